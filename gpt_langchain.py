@@ -1,4 +1,8 @@
 ##
+import asyncio
+import json
+import logging
+import time
 from typing import List, Dict, Tuple
 import pandas as pd
 import os
@@ -6,13 +10,46 @@ from dotenv import load_dotenv, find_dotenv
 import openai
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import ResponseSchema
-from langchain.output_parsers import StructuredOutputParser
 from config import path_vocabulary, path_project
+from semantic_cache import SemanticCache, cached_response
 
 
 _ = load_dotenv(find_dotenv())
 openai.api_key = os.environ['OPENAI_API_KEY']
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    An asynchronous token bucket limiting the rate of requests. The bucket holds at most `capacity` tokens and is
+    refilled with `rate` tokens per second; every request takes one token, and waits until one is available.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        :param rate: the number of tokens added to the bucket per second
+        :param capacity: the maximum number of tokens in the bucket, i.e. the largest burst of requests
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Takes one token from the bucket, waiting until it is refilled if it is empty. Waiting requests are served
+        in the order they arrived.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
 
 class SentenceGenerator:
@@ -36,56 +73,94 @@ class SentenceGenerator:
         and return them as a list of strings.
 
         Ensure that all the lists have the same length. Make sure the sentences are a little creative, interesting, fun.
-
-        {format_instructions}
         """
 
     model_original = 'gpt-3.5-turbo'
-    model_better = 'gpt-3.5-turbo-16k'
+    model_better = 'gpt-4o-mini'
+    max_concurrency = 50
+    requests_per_minute = 500
+    batch_poll_interval = 60
 
     def __init__(self):
         self.chunks = dict()
+        self.cache = SemanticCache(cache_dir=f'{path_project}/.sem_cache')
+        self.response_format = self._get_response_format()
+        self.chat = ChatOpenAI(
+            temperature=0.0, model_name=self.model_better, model_kwargs={'response_format': self.response_format},
+        )
+        self.prompt_template = ChatPromptTemplate.from_template(self.template_string)
 
     @staticmethod
-    def _get_output_parser_and_format_instructions() -> Tuple[StructuredOutputParser, str]:
+    def _get_response_format() -> Dict:
         """
-        Creates a StructuredOutputParser object and a string of format instructions for the API
-        response and returns them as a tuple.
+        Creates the JSON schema the API response has to follow, in the format of the response_format
+        request parameter. The API enforces the schema itself, so no format instructions are added to the prompt.
 
         :return:
-        A tuple of a StructuredOutputParser object and a string of format instructions for the API response.
+        A dictionary representing the response_format of the chat completion requests.
         """
-        german_word_schema = ResponseSchema(
-            name="german_word",
-            description='Return the German word as a list of strings, repeating it only if it has distinctly different \
-            meanings that are not synonymous or interchangeable. \
-            For example, if the word "annehmen" has two distinct meanings "to accept" and "to assume", list it twice.',
-        )
-        english_word_schema = ResponseSchema(
-            name="english_word",
-            description="Translate the German word to English, and list only the distinctly different and \
-            most important (frequently used) meanings as a list of strings. \
-            Do not include meanings that are synonymous or interchangeable.",
-        )
-        german_sentence_schema = ResponseSchema(
-            name="german_sentence",
-            description="Create a sentence in German using the word ```{german_word}``` that reflects \
-            each distinct meaning. The sentence should be at difficulty level ```{level}```. \
-            Return these sentences as a list of strings.",
-        )
-        english_sentence_schema = ResponseSchema(
-            name="english_sentence",
-            description="Translate the sentences in the 'german_sentence' list to English, \
-            and return them as a list of strings.",
+        descriptions = {
+            "german_word": "The German word as a list of strings, repeated only if it has distinctly different "
+                           "meanings that are not synonymous or interchangeable.",
+            "english_word": "The distinctly different and most important (frequently used) English meanings "
+                            "of the German word as a list of strings.",
+            "german_sentence": "A German sentence using the German word for each distinct meaning, "
+                               "as a list of strings.",
+            "english_sentence": "The English translations of the sentences in the 'german_sentence' list, "
+                                "as a list of strings.",
+        }
+        properties = {
+            name: {"type": "array", "items": {"type": "string"}, "description": description}
+            for name, description in descriptions.items()
+        }
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "german_word_sentences",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(properties),
+                    "additionalProperties": False,
+                },
+            },
+        }
+
+    @staticmethod
+    def _parse_response(content: str) -> Dict:
+        """
+        Parses the content of an API response that follows the schema of _get_response_format().
+
+        :param content: a string representing the JSON content of the API response
+
+        :return:
+        A dictionary containing lists of German sentences, English translations, and other information.
+        """
+        return json.loads(content)
+
+    def _format_prompt(self, word: str, wordtype: str, level: str) -> List:
+        """
+        Formats the prompt for a German word, its type, and CEFR level.
+
+        :param word: a string representing the German word to be used in the prompt
+        :param wordtype: a string representing the type of the German word (e.g. noun, verb, adjective)
+        :param level: a string representing the CEFR level of the word (e.g. A1, A2, B1, B2, C1)
+
+        :return:
+        A list of the formatted chat messages.
+        """
+        translation = self.prompt_template.format_messages(
+            german_word=word,
+            word_type=wordtype,
+            level=level,
         )
-        response_schemas = [german_word_schema, english_word_schema, german_sentence_schema, english_sentence_schema]
-        output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
-        format_instructions = output_parser.get_format_instructions()
-        return output_parser, format_instructions
+        return translation
 
+    @cached_response
     def _get_api_response(self, word: str, wordtype: str, level: str) -> Dict:
         """
-        Sends a prompt to the GPT-3.5 API containing a German word, its type, and CEFR level, and
+        Sends a prompt to the GPT API containing a German word, its type, and CEFR level, and
         returns a dictionary of sentences and their translations.
 
         :param word: a string representing the German word to be used in the prompt
@@ -95,27 +170,41 @@ class SentenceGenerator:
         :return:
         A dictionary containing lists of German sentences, English translations, and other information.
         """
-        chat = ChatOpenAI(temperature=0.0, model_name=self.model_better)
-
-        prompt_template = ChatPromptTemplate.from_template(self.template_string)
+        translation = self._format_prompt(word=word, wordtype=wordtype, level=level)
+        response = self.chat(translation)
+        output_dict = self._parse_response(response.content)
+        return output_dict
 
-        output_parser, format_instructions = self._get_output_parser_and_format_instructions()
+    @cached_response
+    async def _aget_api_response(
+            self, semaphore: asyncio.Semaphore, rate_limiter: TokenBucket, word: str, wordtype: str, level: str,
+    ) -> Dict:
+        """
+        Asynchronous counterpart of _get_api_response(). The semaphore bounds how many requests are in flight
+        at the same time, and the rate limiter how many are sent per minute, so that the API rate limits
+        are respected.
 
-        translation = prompt_template.format_messages(
-            german_word=word,
-            word_type=wordtype,
-            level=level,
-            format_instructions=format_instructions,
-        )
+        :param semaphore: an asyncio.Semaphore limiting the number of concurrent requests
+        :param rate_limiter: a TokenBucket limiting the number of requests per minute
+        :param word: a string representing the German word to be used in the prompt
+        :param wordtype: a string representing the type of the German word (e.g. noun, verb, adjective)
+        :param level: a string representing the CEFR level of the word (e.g. A1, A2, B1, B2, C1)
 
-        response = chat(translation)
-        output_dict = output_parser.parse(response.content)
+        :return:
+        A dictionary containing lists of German sentences, English translations, and other information.
+        """
+        translation = self._format_prompt(word=word, wordtype=wordtype, level=level)
+        async with semaphore:
+            await rate_limiter.acquire()
+            response = await self.chat.apredict_messages(translation)
+        output_dict = self._parse_response(response.content)
         return output_dict
 
-    def _get_api_responses_for_dataframe(self, df: pd.DataFrame, col_name: str) -> List:
+    async def _aget_api_responses_for_dataframe(self, df: pd.DataFrame, col_name: str) -> List:
         """
-        Iterates over a DataFrame containing German words and their CEFR levels, calls the
-        _get_api_response() method for each row, and returns a list of dictionaries of sentences and their translations.
+        Sends the prompts for all rows of a DataFrame concurrently, at most max_concurrency at a time and
+        requests_per_minute per minute, and returns the responses in the order of the rows. Rows whose request
+        failed are logged and left out.
 
         :param df: a pandas DataFrame containing German words and their CEFR levels
         :param col_name: a string representing the name of the column containing the German words in the DataFrame
@@ -123,14 +212,39 @@ class SentenceGenerator:
         :return:
         A list of dictionaries containing lists of German sentences, English translations, and other information.
         """
+        rows = list(zip(df[col_name], df['word_type'], df['level']))
+        await asyncio.to_thread(self.cache.prefetch, rows)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        rate_limiter = TokenBucket(rate=self.requests_per_minute / 60, capacity=self.max_concurrency)
+        tasks = [
+            asyncio.create_task(self._aget_api_response(
+                semaphore=semaphore, rate_limiter=rate_limiter, word=word, wordtype=wordtype, level=level,
+            ))
+            for word, wordtype, level in rows
+        ]
         results = []
-        for index, row in df.iterrows():
-            word = row[col_name]
-            wordtype = row['word_type']
-            level = row['level']
-            output_dict = self._get_api_response(word=word, wordtype=wordtype, level=level)
-            print(output_dict)
-            results.append(output_dict)
+        for (word, wordtype, level), result in zip(rows, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.warning('Request for "%s" (%s, %s) failed: %s', word, wordtype, level, result)
+                continue
+            results.append(result)
+        return results
+
+    def _get_api_responses_for_dataframe(self, df: pd.DataFrame, col_name: str) -> List:
+        """
+        Calls the API for every row of a DataFrame containing German words and their CEFR levels, and returns a list
+        of dictionaries of sentences and their translations. The requests are sent concurrently,
+        see _aget_api_responses_for_dataframe().
+
+        :param df: a pandas DataFrame containing German words and their CEFR levels
+        :param col_name: a string representing the name of the column containing the German words in the DataFrame
+
+        :return:
+        A list of dictionaries containing lists of German sentences, English translations, and other information.
+        """
+        results = asyncio.run(self._aget_api_responses_for_dataframe(df=df, col_name=col_name))
+        for output_dict in results:
+            logger.debug("%s", output_dict)
         return results
 
     @staticmethod
@@ -145,31 +259,29 @@ class SentenceGenerator:
         :return:
         A flattened pandas DataFrame containing German sentences, English translations, and other information.
         """
-        flat_data = []
-        for item in list_of_dicts:
-            num_entries = len(item["german_word"])
-            for i in range(num_entries):
-                flat_data.append({
-                    "german_word": item["german_word"][i],
-                    "english_word": item["english_word"][i],
-                    "german_sentence": item["german_sentence"][i],
-                    "english_sentence": item["english_sentence"][i]
-                })
-        df = pd.DataFrame(flat_data)
+        columns = ["german_word", "english_word", "german_sentence", "english_sentence"]
+        flat_data = {
+            column: [value for item in list_of_dicts for value in item[column][:len(item["german_word"])]]
+            for column in columns
+        }
+        df = pd.DataFrame(flat_data, columns=columns)
         return df
 
     @staticmethod
     def _upload_df(df_path: str) -> pd.DataFrame:
         """
         Reads a CSV file containing German words and their CEFR levels, and returns a pandas DataFrame.
+        The file is parsed by the multi-threaded pyarrow engine, and the level and word type columns are stored as
+        categoricals, since they only take a handful of values.
 
         :param df_path: a string representing the path to the CSV file containing the German words and their CEFR levels
 
         :return:
         A pandas DataFrame containing German words and their CEFR levels.
         """
-        df = pd.read_csv(df_path, delimiter=',', encoding='utf-16')
-        df[['level', 'word_type']] = df['level_type'].str.split('_', expand=True)
+        df = pd.read_csv(df_path, delimiter=',', encoding='utf-16', dtype={'level_type': 'category'}, engine='pyarrow')
+        parts = df['level_type'].astype(str).str.split('_', n=1, expand=True)
+        df[['level', 'word_type']] = parts.astype('category')
         return df
 
     def get_chunks(self, word_type: str, df_path: str):
@@ -182,9 +294,10 @@ class SentenceGenerator:
         """
         df = self._upload_df(df_path=df_path)
         filter_through = [f'a1_{word_type}', f'a2_{word_type}', f'b1_{word_type}', f'b2_{word_type}', f'c1_{word_type}']
+        df_wanted = df[df['level_type'].isin(filter_through)]
+        groups = dict(tuple(df_wanted.groupby('level_type', observed=True, sort=False)))
         for filtering in filter_through:
-            df_subset = df[df['level_type'] == filtering]
-            self.chunks[filtering] = df_subset
+            self.chunks[filtering] = groups.get(filtering, df.iloc[0:0])
 
     def get_df_level(self, level_word_type: str) -> pd.DataFrame:
         """
@@ -197,28 +310,241 @@ class SentenceGenerator:
         """
         return self.chunks[level_word_type]
 
-    def process_data(self, df: pd.DataFrame, col_name: str) -> pd.DataFrame:
+    @staticmethod
+    def _get_custom_id(index, wordtype: str, level: str) -> str:
+        """
+        Builds the identifier that links a request of a Batch API job to the row of the DataFrame it was created from.
+
+        :param index: the index label of the row in the DataFrame
+        :param wordtype: a string representing the type of the German word (e.g. noun, verb, adjective)
+        :param level: a string representing the CEFR level of the word (e.g. A1, A2, B1, B2, C1)
+
+        :return: A string that is unique for the row.
+        """
+        return f'{level}_{wordtype}_{index}'
+
+    def build_batch_jsonl(self, rows: List[Tuple], batch_path: str) -> List[str]:
+        """
+        A public method that writes one chat completion request per row into a JSONL file, in the
+        input format of the OpenAI Batch API.
+
+        :param rows: a list of (index, word, word type, level) tuples, where index is the index label of the row
+        in its DataFrame
+        :param batch_path: a string representing the path of the JSONL file to be written
+
+        :return: A list of the custom ids of the requests, in the order of the rows.
+        """
+        custom_ids = []
+        with open(batch_path, 'w', encoding='utf-8') as batch_file:
+            for index, word, wordtype, level in rows:
+                translation = self._format_prompt(word=word, wordtype=wordtype, level=level)
+                custom_id = self._get_custom_id(index=index, wordtype=wordtype, level=level)
+                request = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self.model_better,
+                        "temperature": 0.0,
+                        "response_format": self.response_format,
+                        "messages": [{"role": "user", "content": message.content} for message in translation],
+                    },
+                }
+                batch_file.write(json.dumps(request, ensure_ascii=False) + '\n')
+                custom_ids.append(custom_id)
+        return custom_ids
+
+    @staticmethod
+    def _submit_batch(batch_path: str) -> str:
+        """
+        Uploads a JSONL file of requests and creates a Batch API job for it.
+
+        :param batch_path: a string representing the path of the JSONL file with the requests
+
+        :return: A string representing the id of the batch job.
+        """
+        with open(batch_path, 'rb') as batch_file:
+            input_file = openai.files.create(file=batch_file, purpose='batch')
+        batch = openai.batches.create(
+            input_file_id=input_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h',
+        )
+        return batch.id
+
+    def _wait_for_batch(self, batch_id: str) -> str:
+        """
+        Polls a Batch API job until it is finished, logging its progress, and returns the id of its output file.
+
+        :param batch_id: a string representing the id of the batch job
+
+        :return: A string representing the id of the output file of the batch job.
+        """
+        batch = openai.batches.retrieve(batch_id)
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            counts = batch.request_counts
+            if counts:
+                logger.info(
+                    'Batch %s is %s: %s of %s requests completed, %s failed',
+                    batch_id, batch.status, counts.completed, counts.total, counts.failed,
+                )
+            else:
+                logger.info('Batch %s is %s', batch_id, batch.status)
+            time.sleep(self.batch_poll_interval)
+            batch = openai.batches.retrieve(batch_id)
+        if batch.status != 'completed':
+            raise RuntimeError(f"Batch {batch_id} finished with status '{batch.status}'.")
+        if batch.error_file_id:
+            logger.warning('Batch %s has failed requests, see error file %s', batch_id, batch.error_file_id)
+        if not batch.output_file_id:
+            raise RuntimeError(
+                f"Batch {batch_id} completed without any successful request, see error file {batch.error_file_id}."
+            )
+        logger.info('Batch %s completed', batch_id)
+        return batch.output_file_id
+
+    def _read_batch_results(self, output_file_id: str) -> Dict[str, Dict]:
+        """
+        Reads the output file of a Batch API job, and parses every successful response. Failed, refused, truncated
+        and unparsable responses are logged and left out, so that they do not discard the rest of the batch.
+
+        :param output_file_id: a string representing the id of the output file of the batch job
+
+        :return:
+        A dictionary mapping the custom ids of the requests to dictionaries containing lists of German sentences,
+        English translations, and other information.
+        """
+        contents = {}
+        for line in openai.files.content(output_file_id).text.splitlines():
+            if not line:
+                continue
+            result = json.loads(line)
+            custom_id = result['custom_id']
+            response = result.get('response')
+            if result.get('error') or not response or response['status_code'] != 200:
+                logger.warning('Request "%s" failed: %s', custom_id, result.get('error') or response)
+                continue
+            choice = response['body']['choices'][0]
+            message = choice['message']
+            if message.get('refusal'):
+                logger.warning('Request "%s" was refused: %s', custom_id, message['refusal'])
+                continue
+            if choice.get('finish_reason') != 'stop':
+                logger.warning('Request "%s" was cut off, finish reason "%s"', custom_id, choice.get('finish_reason'))
+                continue
+            try:
+                contents[custom_id] = self._parse_response(message['content'])
+            except (TypeError, json.JSONDecodeError) as error:
+                logger.warning('Response to request "%s" could not be parsed: %s', custom_id, error)
+        return contents
+
+    def _get_batch_responses(self, chunks: Dict[str, Tuple[pd.DataFrame, str]], batch_path: str) -> Dict[str, List]:
+        """
+        Generates the sentences for all rows of several DataFrames with a single Batch API job, and returns the lists
+        of dictionaries of sentences and their translations per DataFrame. Rows with a cached response are left out
+        of the job, and the new responses are added to the cache.
+
+        :param chunks: a dictionary mapping a name to a pandas DataFrame containing German words and their CEFR levels,
+        and the name of the column containing the German words in it
+        :param batch_path: a string representing the path of the JSONL file to be written
+
+        :return:
+        A dictionary mapping the names of the chunks to lists of dictionaries containing lists of German sentences,
+        English translations, and other information.
+        """
+        chunk_rows = {
+            name: list(zip(df.index, df[col_name], df['word_type'], df['level']))
+            for name, (df, col_name) in chunks.items()
+        }
+        all_rows = [row for rows in chunk_rows.values() for row in rows]
+        self.cache.prefetch((word, wordtype, level) for index, word, wordtype, level in all_rows)
+
+        cached = {}
+        missing = []
+        for index, word, wordtype, level in all_rows:
+            custom_id = self._get_custom_id(index=index, wordtype=wordtype, level=level)
+            output_dict = self.cache.get(word=word, wordtype=wordtype, level=level)
+            if output_dict is not None:
+                cached[custom_id] = output_dict
+            else:
+                missing.append((index, word, wordtype, level))
+
+        batch_results = {}
+        if missing:
+            self.build_batch_jsonl(rows=missing, batch_path=batch_path)
+            batch_id = self._submit_batch(batch_path=batch_path)
+            logger.info('Submitted batch %s with %s requests, %s rows were cached', batch_id, len(missing), len(cached))
+            output_file_id = self._wait_for_batch(batch_id=batch_id)
+            batch_results = self._read_batch_results(output_file_id=output_file_id)
+
+        results = {}
+        for name, rows in chunk_rows.items():
+            results[name] = []
+            for index, word, wordtype, level in rows:
+                custom_id = self._get_custom_id(index=index, wordtype=wordtype, level=level)
+                if custom_id in cached:
+                    output_dict = cached[custom_id]
+                elif custom_id in batch_results:
+                    output_dict = batch_results[custom_id]
+                    self.cache.put(word=word, wordtype=wordtype, level=level, response=output_dict)
+                else:
+                    logger.warning('No response for request "%s"', custom_id)
+                    continue
+                logger.debug("%s", output_dict)
+                results[name].append(output_dict)
+        return results
+
+    def process_chunks(self, chunks: Dict[str, Tuple[pd.DataFrame, str]]) -> Dict[str, pd.DataFrame]:
+        """
+        Generate sentences and their translations for several DataFrames of word chunks with a single Batch API job,
+        which is cheaper than sending the requests directly but can take up to 24 hours, and returns the flattened
+        DataFrames.
+
+        :param chunks: a dictionary mapping a name to a pandas DataFrame containing German words and their CEFR levels,
+        and the name of the column containing the German words in it
+
+        :return: A dictionary mapping the names of the chunks to flattened pandas DataFrames containing German
+        sentences, English translations, and other information.
+        """
+        results = self._get_batch_responses(chunks=chunks, batch_path=f'{path_project}/corpus_batch.jsonl')
+        self.cache.save()
+        return {
+            name: self._create_dataframe_from_list_of_dict(list_of_dicts=list_of_dicts)
+            for name, list_of_dicts in results.items()
+        }
+
+    def process_data(self, df: pd.DataFrame, col_name: str, use_batch_api: bool = True) -> pd.DataFrame:
         """
         Generate sentences and their translations for a DataFrame of word chunks, and returns the flattened DataFrame.
+        By default, the requests are submitted as one Batch API job, see process_chunks(); otherwise they are sent to
+        the API directly.
 
         :param df: a pandas DataFrame containing German words and their CEFR levels
         :param col_name: a string representing the name of the column containing the German words in the DataFrame
+        :param use_batch_api: whether to submit the requests via the Batch API
 
         :return: A flattened pandas DataFrame containing German sentences, English translations, and other information.
         """
-        list_of_dicts = sentence_generator._get_api_responses_for_dataframe(df=df, col_name=col_name)
+        if use_batch_api:
+            return self.process_chunks(chunks={col_name: (df, col_name)})[col_name]
+        list_of_dicts = self._get_api_responses_for_dataframe(df=df, col_name=col_name)
+        self.cache.save()
         result_df = self._create_dataframe_from_list_of_dict(list_of_dicts=list_of_dicts)
         return result_df
 
 ##
 
 
+logging.basicConfig(level=logging.INFO)
 sentence_generator = SentenceGenerator()
 word_types = ['verb', 'noun', 'adjective', 'adverb', 'number']
 
+corpus = {}
 for word_ in word_types:
     level_wordtype = 'a1_' + word_
     sentence_generator.get_chunks(word_type=word_, df_path=f'{path_vocabulary}/{word_}.csv')
-    data = sentence_generator.get_df_level(level_word_type=level_wordtype)
-    res_df = sentence_generator.process_data(df=data, col_name=word_)
-    res_df.to_excel(f'{path_project}/{level_wordtype}.xlsx', index=False)
+    corpus[level_wordtype] = (sentence_generator.get_df_level(level_word_type=level_wordtype), word_)
+
+# one Batch API job for the whole corpus, instead of one job per word type
+for level_wordtype, res_df in sentence_generator.process_chunks(chunks=corpus).items():
+    res_df.to_excel(f'{path_project}/{level_wordtype}.xlsx', index=False, engine='xlsxwriter')
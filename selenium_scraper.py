@@ -1,16 +1,21 @@
 ##
-from typing import Dict, List
+import logging
+from typing import Dict, List, Optional
 import pandas as pd
 from selenium import webdriver
-import time
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as ec
 from pathlib import Path
-from selenium.common.exceptions import NoSuchElementException, ElementNotInteractableException, TimeoutException
+from selenium.common.exceptions import (
+    NoSuchElementException, ElementNotInteractableException, TimeoutException, StaleElementReferenceException,
+)
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.remote.webelement import WebElement
 from config import page_url, my_email, my_password, csv_file_path
 
+logger = logging.getLogger(__name__)
+
 
 class ScrapeWords:
     """
@@ -24,6 +29,7 @@ class ScrapeWords:
     VOCAB_BUTTON_XPATH = '//*[@id="root"]/div/div[1]/header/div/div[2]/div[1]/a[2]/div/div[2]'
     NEXT_BUTTON_XPATH = '/html/body/div/div/div[2]/div/div[3]/div/div/div[1]/div/div[4]/div/div[2]/div[21]/div[2]'
     DEFAULT_XPATH = '//*[@id="root"]/div/div[2]/div/div[2]/div[1]'
+    WORDS_CLASS_NAME = 'text.css-1x8qkb1'
 
     levels = ['a1', 'a2', 'b1', 'b2', 'c1']
     word_types = ['adjective', 'adverb', 'noun', 'number', 'verb']
@@ -61,30 +67,74 @@ class ScrapeWords:
         list_of_words = []
         while True:
             try:
-                time.sleep(5)
-                texts = self.driver.find_elements(By.CLASS_NAME, 'text.css-1x8qkb1')
-                for i in range(len(texts)):
-                    list_of_words.append(texts[i].text)
+                texts = self._wait_for(find_by=By.CLASS_NAME, path=self.WORDS_CLASS_NAME)
+                words = [text.text for text in texts]
+                list_of_words.extend(words)
                 current_url = self.driver.current_url
                 try:
                     self._click_button(wait=wait, find_by=By.XPATH, path=self.NEXT_BUTTON_XPATH)  # next button
                     wait.until(ec.url_changes(current_url))
+                    self._wait_for_words_to_change(old_text=words[0], action='going to the next page')
                 except TimeoutException:
                     break
-            except (NoSuchElementException, ElementNotInteractableException, IndexError):
+            except (
+                NoSuchElementException, ElementNotInteractableException, IndexError, TimeoutException,
+                StaleElementReferenceException,
+            ):
                 break
         return list_of_words
 
+    def _get_first_word_text(self) -> Optional[str]:
+        """
+        Get the text of the first word of the list currently displayed, without waiting for it.
+
+        :return: The text, or None if no list is displayed or it is being replaced.
+        """
+        words = self.driver.find_elements(By.CLASS_NAME, self.WORDS_CLASS_NAME)
+        try:
+            return words[0].text if words else None
+        except StaleElementReferenceException:
+            return None
+
+    def _wait_for_words_to_change(self, old_text: Optional[str], action: str) -> None:
+        """
+        Wait until the first word of the list differs from the one displayed before a click. The text is compared
+        rather than the element, as the website may reuse the elements of the list. If the first word is still the
+        same after the timeout, e.g. because the new list happens to start with it, the list is read as it is.
+
+        :param old_text: The first word displayed before the click, or None if there was none.
+        :param action: A description of the click, used in the log.
+        """
+        if old_text is None:
+            return
+        wait = WebDriverWait(self.driver, 10)
+        try:
+            wait.until(lambda driver: self._get_first_word_text() not in (None, old_text))
+        except TimeoutException:
+            logger.warning('The first word is still "%s" after %s, reading the list as it is', old_text, action)
+
+    def _wait_for(self, find_by: By, path: str) -> List[WebElement]:
+        """
+        Wait until the elements matching a selector are present on the webpage.
+
+        :param find_by: The type of selector to be used for finding the elements.
+        :param path: The path of the elements.
+        :return: A list of the elements.
+        """
+        wait = WebDriverWait(self.driver, 10)
+        return wait.until(ec.presence_of_all_elements_located((find_by, path)))
+
     def _hover_mouse_somewhere_and_click(self, find_by: By, path: str = None) -> None:
         """
-        Hover the mouse over an element on the webpage and click it.
+        Hover the mouse over an element on the webpage as soon as it is clickable, and click it.
 
         :param find_by: The type of selector to be used for finding the element.
         :param path: The path of the element. Default is None.
         """
         if not path:
             path = self.DEFAULT_XPATH
-        element = self.driver.find_element(find_by, path)
+        wait = WebDriverWait(self.driver, 10)
+        element = wait.until(ec.element_to_be_clickable((find_by, path)))
         action = ActionChains(self.driver).move_to_element(element)
         action.perform()
         element.click()
@@ -107,7 +157,7 @@ class ScrapeWords:
 
         :param pixels: The number of pixels to scroll down.
         """
-        element = self.driver.find_element(By.CLASS_NAME, 'css-i2r08k')
+        element = self._wait_for(find_by=By.CLASS_NAME, path='css-i2r08k')[0]
         self.driver.execute_script(f"arguments[0].scrollTop += {pixels}", element)
 
     def _perform_scraping_within_levels(self, word_type) -> Dict[str, str]:
@@ -122,22 +172,25 @@ class ScrapeWords:
 
         for j, lvl in zip(range(2, 7), self.levels):
             if j >= 3:
-                time.sleep(3)
                 self._hover_mouse_somewhere_and_click(find_by=By.XPATH)
                 self._click_button(wait=wait, find_by=By.CLASS_NAME, path='css-1kao6un')  # unclick previous
-                time.sleep(3)
                 self._hover_mouse_somewhere_and_click(find_by=By.CLASS_NAME, path='css-45ydyn')  # menu
 
-            time.sleep(3)
             base_xpath_levels = f'//*[@id="root"]/div/div[2]/div/div[3]/div/div/div[1]/div/div[2]/div/div[1]/' \
                                 f'div[2]/div[2]/div/div[1]/div[2]/div[1]/div[2]/div[{j}]/div[2]'
-            time.sleep(3)
+            old_text = self._get_first_word_text()
             self._hover_mouse_somewhere_and_click(find_by=By.XPATH, path=base_xpath_levels)  # click on level
             self._click_button(wait=wait, find_by=By.CLASS_NAME, path='css-1vb9g26')  # close menu button
 
             try:
+                # the words of the previous level must not be read again and labelled with this level
+                self._wait_for_words_to_change(old_text=old_text, action=f'selecting {lvl}_{word_type}')
                 list_words = self._scrape_vocab_by_type_and_level()
-            except (NoSuchElementException, ElementNotInteractableException, IndexError):
+            except (
+                NoSuchElementException, ElementNotInteractableException, IndexError, TimeoutException,
+                StaleElementReferenceException,
+            ) as error:
+                logger.warning('Skipping %s_%s, the words could not be read: %r', lvl, word_type, error)
                 continue
 
             value_name = [lvl + '_' + word_type]
@@ -164,9 +217,7 @@ class ScrapeWords:
         wait = WebDriverWait(self.driver, 10)
         self._hover_mouse_somewhere_and_click(find_by=By.XPATH)
         self._click_button(wait=wait, find_by=By.CLASS_NAME, path='css-45ydyn')  # menu
-        time.sleep(4)
         self._scroll_down(pixels=150)
-        time.sleep(4)
         base_xpath_word_types = f'//*[@id="root"]/div/div[2]/div/div[3]/div/div/div[1]/div/div[2]/div/div[1]/' \
                                 f'div[2]/div[2]/div/div[1]/div[2]/div[2]/div[2]/div[{path_number}]/div[2]'
         self._hover_mouse_somewhere_and_click(find_by=By.XPATH, path=base_xpath_word_types)  # click on word types
@@ -208,6 +259,7 @@ class ScrapeWords:
         df.to_csv(csv_path, index=False, encoding='utf-16')
 
 
+logging.basicConfig(level=logging.INFO)
 perform_scraping = ScrapeWords()
 perform_scraping.navigate_to_main_page(url=page_url, email=my_email, password=my_password)
 
@@ -0,0 +1,214 @@
+##
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import shelve
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import faiss
+import numpy as np
+import openai
+
+
+class SemanticCache:
+    """
+    A persistent cache of parsed API responses. A response is looked up by the exact word, word type and level first,
+    and otherwise by the cosine similarity of the word's embedding to the words already cached for the same word type
+    and level.
+    """
+
+    embedding_model = 'text-embedding-3-small'
+    # the embeddings endpoint accepts at most 2048 inputs per request
+    embedding_batch_size = 2048
+    similarity_threshold = 0.97
+
+    def __init__(self, cache_dir: str):
+        """
+        Opens the cache stored in a directory, creating the directory if it does not exist yet.
+
+        :param cache_dir: Path to the directory holding the cache files.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.cache_dir / 'keys.json'
+        self.responses = shelve.open(str(self.cache_dir / 'responses'))
+        self.indexes = {}
+        self.keys = {}
+        if self.keys_path.exists():
+            keys = json.loads(self.keys_path.read_text(encoding='utf-8'))
+            # older caches kept a single index for all groups in a list, those are not reused
+            self.keys = keys if isinstance(keys, dict) else {}
+            for group in self.keys:
+                self.indexes[group] = faiss.read_index(str(self._get_index_path(group)))
+        self._embeddings = {}
+        self._lock = threading.Lock()
+        self._changed = False
+
+    def _get_index_path(self, group: str) -> Path:
+        """
+        Builds the path of the embedding index of a word type and level.
+
+        :param group: The normalized word type and level, see _get_group().
+        :return: The path of the index file.
+        """
+        return self.cache_dir / f'index_{group}.faiss'
+
+    @staticmethod
+    def _get_group(wordtype: str, level: str) -> str:
+        """
+        Normalizes a word type and CEFR level into the name of the group whose words are compared semantically.
+
+        :param wordtype: The type of the word (e.g. noun, verb, adjective).
+        :param level: The CEFR level of the word (e.g. A1, A2, B1, B2, C1).
+        :return: The name of the group.
+        """
+        return f'{level.strip().lower()}_{wordtype.strip().lower()}'
+
+    def _get_key(self, word: str, wordtype: str, level: str) -> str:
+        """
+        Hashes a word, its type and CEFR level into the key of the exact lookup.
+
+        :param word: The German word.
+        :param wordtype: The type of the word (e.g. noun, verb, adjective).
+        :param level: The CEFR level of the word (e.g. A1, A2, B1, B2, C1).
+        :return: The SHA256 hex digest of the normalized word and group.
+        """
+        text = f'{word.strip().lower()} ({self._get_group(wordtype=wordtype, level=level)})'
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def prefetch(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        """
+        Computes the embeddings of all words without an exact cache entry with as few API requests as possible, so
+        that the following lookups and inserts do not call the API one word at a time.
+
+        :param rows: The (word, word type, level) tuples that are going to be looked up.
+        """
+        with self._lock:
+            words = {
+                word.strip().lower() for word, wordtype, level in rows
+                if self._get_key(word=word, wordtype=wordtype, level=level) not in self.responses
+            }
+        self._embed(sorted(words - set(self._embeddings)))
+
+    def _embed(self, words: List[str]) -> None:
+        """
+        Computes the L2-normalized embeddings of words, so that the inner product of two embeddings is their cosine
+        similarity, and memoizes them. The words are sent in requests of at most embedding_batch_size inputs.
+
+        :param words: The normalized words.
+        """
+        for start in range(0, len(words), self.embedding_batch_size):
+            batch = words[start:start + self.embedding_batch_size]
+            response = openai.embeddings.create(model=self.embedding_model, input=batch)
+            embeddings = np.array([item.embedding for item in response.data], dtype=np.float32)
+            faiss.normalize_L2(embeddings)
+            for word, embedding in zip(batch, embeddings):
+                self._embeddings[word] = embedding.reshape(1, -1)
+
+    def _get_embedding(self, word: str) -> np.ndarray:
+        """
+        Gets the embedding of a word, computing it if it was not prefetched.
+
+        :param word: The German word.
+        :return: A float32 array of shape (1, dimension).
+        """
+        word = word.strip().lower()
+        if word not in self._embeddings:
+            self._embed([word])
+        return self._embeddings[word]
+
+    def get(self, word: str, wordtype: str, level: str) -> Optional[Dict]:
+        """
+        Looks up the cached response for a word, its type and CEFR level.
+
+        :param word: The German word.
+        :param wordtype: The type of the word (e.g. noun, verb, adjective).
+        :param level: The CEFR level of the word (e.g. A1, A2, B1, B2, C1).
+        :return: The cached response, or None if there is none similar enough.
+        """
+        key = self._get_key(word=word, wordtype=wordtype, level=level)
+        group = self._get_group(wordtype=wordtype, level=level)
+        with self._lock:
+            if key in self.responses:
+                return self.responses[key]
+            if group not in self.indexes:
+                return None
+        embedding = self._get_embedding(word)
+        with self._lock:
+            scores, ids = self.indexes[group].search(embedding, 1)
+            if scores[0][0] >= self.similarity_threshold:
+                return self.responses[self.keys[group][ids[0][0]]]
+        return None
+
+    def put(self, word: str, wordtype: str, level: str, response: Dict) -> None:
+        """
+        Stores the response for a word, its type and CEFR level. The embedding indexes are only written to disk
+        by save().
+
+        :param word: The German word.
+        :param wordtype: The type of the word (e.g. noun, verb, adjective).
+        :param level: The CEFR level of the word (e.g. A1, A2, B1, B2, C1).
+        :param response: The parsed API response.
+        """
+        key = self._get_key(word=word, wordtype=wordtype, level=level)
+        group = self._get_group(wordtype=wordtype, level=level)
+        embedding = self._get_embedding(word)
+        with self._lock:
+            is_new = key not in self.responses
+            self.responses[key] = response
+            if not is_new:
+                return
+            if group not in self.indexes:
+                self.indexes[group] = faiss.IndexFlatIP(embedding.shape[1])
+                self.keys[group] = []
+            self.indexes[group].add(embedding)
+            self.keys[group].append(key)
+            self._changed = True
+
+    def save(self) -> None:
+        """
+        Writes the responses, the embedding indexes and their keys to disk, if anything was added since the last save.
+        """
+        with self._lock:
+            self.responses.sync()
+            if not self._changed:
+                return
+            for group, index in self.indexes.items():
+                faiss.write_index(index, str(self._get_index_path(group)))
+            self.keys_path.write_text(json.dumps(self.keys), encoding='utf-8')
+            self._changed = False
+
+
+def cached_response(func: Callable) -> Callable:
+    """
+    Decorates a method of an object with a `cache` attribute holding a SemanticCache. The method has to be called with
+    the keyword arguments `word`, `wordtype` and `level`; the API is only called if no similar response is cached yet.
+    Both plain methods and coroutine methods are supported; for the latter, the cache is accessed in a worker thread
+    so that the event loop is not blocked.
+
+    :param func: The method to be decorated.
+    :return: The decorated method.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, *args, **kwargs) -> Dict:
+            keys = dict(word=kwargs['word'], wordtype=kwargs['wordtype'], level=kwargs['level'])
+            response = await asyncio.to_thread(self.cache.get, **keys)
+            if response is None:
+                response = await func(self, *args, **kwargs)
+                await asyncio.to_thread(self.cache.put, response=response, **keys)
+            return response
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs) -> Dict:
+        keys = dict(word=kwargs['word'], wordtype=kwargs['wordtype'], level=kwargs['level'])
+        response = self.cache.get(**keys)
+        if response is None:
+            response = func(self, *args, **kwargs)
+            self.cache.put(response=response, **keys)
+        return response
+    return wrapper
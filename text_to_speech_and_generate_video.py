@@ -1,18 +1,25 @@
 ##
+import functools
+import hashlib
 import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
 from typing import List, Tuple
+import numpy as np
 import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+from google.api_core.client_options import ClientOptions
 from google.oauth2.service_account import Credentials
 from google.cloud import texttospeech
-from moviepy.audio.AudioClip import concatenate_audioclips
-from pydub import AudioSegment
-import io
-from moviepy.config import change_settings
-from moviepy.editor import TextClip, concatenate_videoclips, AudioFileClip
-from config import credential_path, words_file_path, ffmpeg_path
-
-
-change_settings({"IMAGEMAGICK_BINARY": r"C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe"})
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+from moviepy.config import get_setting
+from moviepy.editor import VideoClip, concatenate_videoclips, AudioFileClip
+from config import credential_path, words_file_path
 
 
 class TextToSpeechConverterAndVideoGenerator:
@@ -21,44 +28,73 @@ class TextToSpeechConverterAndVideoGenerator:
     text and the output audio.
     """
 
+    CACHE_DIR = Path('tts_cache')
+    FONT_PATH = 'calibri.ttf'
+    FONT_SIZE = 85
+    FRAME_SIZE = (1920, 1080)
+    SOFTWARE_CODEC = ('libx264', ['-tune', 'stillimage'])
+
+    max_workers = 16
+    silence_duration = 1500
+
     def __init__(self, credentials_path: str):
         """
-        Initializes the TextToSpeechConverter with Google API credentials.
+        Initializes the TextToSpeechConverter with Google API credentials. The client uses a single gRPC channel,
+        which multiplexes concurrent requests over one HTTP/2 connection, so it is shared by all worker threads
+        instead of creating a client per thread.
 
         :param credentials_path: Path to the Google API credentials file.
         """
         with open(credentials_path) as key_file:
             key_data = json.load(key_file)
         self.creds = Credentials.from_service_account_info(key_data)
-        self.client = texttospeech.TextToSpeechClient(credentials=self.creds)
+        self.client = texttospeech.TextToSpeechClient(
+            credentials=self.creds,
+            transport='grpc',
+            client_options=ClientOptions(api_endpoint='texttospeech.googleapis.com:443'),
+        )
+
+    def _build_ssml(self, segments: List[Tuple[str, str]]) -> str:
+        """
+        Build an SSML document that speaks each text in the voice of its language, with silence_duration
+        milliseconds of silence before and after every text.
+
+        :param segments: List of (language code, text) tuples in the order they should be spoken.
+        :return: SSML document.
+        """
+        silence = f'<break time="{self.silence_duration}ms"/>'
+        gap = f'<break time="{2 * self.silence_duration}ms"/>'
+        voices = [
+            f'<voice language="{lang}" gender="female">{escape(str(text))}</voice>' for lang, text in segments
+        ]
+        return f'<speak>{silence}{gap.join(voices)}{silence}</speak>'
 
-    def _synthesize_text(self, text: str, language_code: str) -> AudioSegment:
+    @functools.lru_cache(maxsize=None)
+    def _get_audio_content(self, ssml: str, language_code: str) -> bytes:
         """
-        Synthesize text to speech.
+        Get the MP3 content of an SSML document, from the on-disk cache if it was synthesized before,
+        otherwise from the Text-to-Speech API. Identical documents are only read or synthesized once per run.
 
-        :param text: Text to be synthesized.
-        :param language_code: Language code for the text (e.g. "en-US" or "de-DE").
-        :return: AudioSegment of the synthesized speech.
+        :param ssml: SSML document to be synthesized.
+        :param language_code: Language code of the default voice (e.g. "en-US" or "de-DE").
+        :return: MP3 content of the synthesized speech.
         """
-        synthesis_input = texttospeech.SynthesisInput(text=text)
+        cache_path = self.CACHE_DIR / f"{hashlib.sha1(language_code.encode() + ssml.encode()).hexdigest()}.mp3"
+        if cache_path.exists():
+            return cache_path.read_bytes()
+
+        synthesis_input = texttospeech.SynthesisInput(ssml=ssml)
         voice = texttospeech.VoiceSelectionParams(
             language_code=language_code, ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
         )
         audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
         response = self.client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
-        return AudioSegment.from_mp3(io.BytesIO(response.audio_content))
-
-    @staticmethod
-    def _add_silence(audio: AudioSegment, duration: int) -> AudioSegment:
-        """
-        Add silence before and after the audio.
-
-        :param audio: AudioSegment to add silence to.
-        :param duration: Duration of silence in milliseconds.
-        :return: AudioSegment with silence added.
-        """
-        silence = AudioSegment.silent(duration=duration)
-        return silence + audio + silence
+        self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # written to a temporary file first and renamed, so that an interrupted run never leaves a truncated file
+        with tempfile.NamedTemporaryFile(dir=self.CACHE_DIR, suffix='.tmp', delete=False) as tmp_file:
+            tmp_file.write(response.audio_content)
+        os.replace(tmp_file.name, cache_path)
+        return response.audio_content
 
     @staticmethod
     def _get_orders(language_mode: str) -> List[List[Tuple[str, str]]]:
@@ -80,35 +116,119 @@ class TextToSpeechConverterAndVideoGenerator:
 
     def generate_audio(self, dataframe: pd.DataFrame, language_version: str) -> None:
         """
-        Generate audio files from DataFrame containing text data.
+        Generate audio files from DataFrame containing text data. Each audio file is synthesized with a single
+        SSML request, and the requests are sent concurrently by max_workers threads sharing the same client.
+        The MP3 content is written as returned by the API, without decoding and re-encoding it.
 
         :param dataframe: DataFrame with columns ['english_word', 'german_word', 'english_sentence', 'german_sentence'].
         :param language_version: Language mode ('EN_DE', 'DE_EN', or 'BOTH').
         """
         process_orders = self._get_orders(language_mode=language_version)
 
-        for i, row in dataframe.iterrows():
-            for order_idx, order in enumerate(process_orders):
-                combined_audio = None
-                for lang, column in order:
-                    audio = self._synthesize_text(row[column], lang)
-                    audio_with_silence = self._add_silence(audio, 1500)
-                    if combined_audio is None:
-                        combined_audio = audio_with_silence
-                    else:
-                        combined_audio += audio_with_silence
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                (i, order_idx): executor.submit(
+                    self._get_audio_content,
+                    self._build_ssml([(lang, getattr(row, column)) for lang, column in order]),
+                    order[0][0],
+                )
+                for i, row in enumerate(dataframe.itertuples(index=False))
+                for order_idx, order in enumerate(process_orders)
+            }
 
+        for i in range(len(dataframe)):
+            for order_idx in range(len(process_orders)):
                 file_index = 0 if language_version != 'BOTH' else order_idx
                 filename = f"{i}_{file_index}.mp3"
-                combined_audio.export(filename, format="mp3")
+                Path(filename).write_bytes(futures[(i, order_idx)].result())
                 print(f'Audio file "{filename}" created')
 
+    @classmethod
+    @functools.lru_cache(maxsize=64)
+    def _render_text(cls, text: str) -> np.ndarray:
+        """
+        Render text in white on a black frame, wrapped to the frame width and centered. The most recently rendered
+        frames are kept, about 6 MB each, so that repeated texts are not rendered again.
+
+        :param text: Text to be rendered, paragraphs separated by newlines.
+        :return: RGB array of shape (height, width, 3).
+        """
+        width, height = cls.FRAME_SIZE
+        font = ImageFont.truetype(cls.FONT_PATH, cls.FONT_SIZE)
+        image = Image.new('RGB', cls.FRAME_SIZE, 'black')
+        draw = ImageDraw.Draw(image)
+
+        lines = []
+        for paragraph in str(text).split('\n'):
+            line = ''
+            for word in paragraph.split():
+                candidate = f'{line} {word}' if line else word
+                if line and draw.textlength(candidate, font=font) > width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = candidate
+            lines.append(line)
+
+        draw.multiline_text(
+            (width / 2, height / 2), '\n'.join(lines), font=font, fill='white', anchor='mm', align='center'
+        )
+        return np.array(image)
+
+    def _generate_slides_clip(self, texts: List[str], duration: float) -> VideoClip:
+        """
+        Generate a clip showing the texts one after another as slides of equal duration.
+
+        :param texts: Texts of the slides, in the order they are shown.
+        :param duration: Duration of the whole clip in seconds.
+        :return: VideoClip of the slides.
+        """
+        frames = [self._render_text(text) for text in texts]
+        slide_duration = duration / len(frames)
+
+        def make_frame(t: float) -> np.ndarray:
+            return frames[min(int(t // slide_duration), len(frames) - 1)]
+
+        return VideoClip(make_frame=make_frame, duration=duration)
+
     @staticmethod
-    def _generate_text_clip(text, audio, duration_split) -> TextClip:
-        clip = TextClip(
-            text, fontsize=85, color='white', font='Calibri', size=(1920, 1080), method='caption'
-        ).set_duration(audio.duration / duration_split)
-        return clip
+    def _concatenate_audio_files(audio_filenames: List[str], output_filename: str) -> None:
+        """
+        Concatenate MP3 files with the ffmpeg concat demuxer. The files share the same encoding, so the frames are
+        copied as they are instead of being decoded and re-encoded.
+
+        :param audio_filenames: Names of the MP3 files, in the order they are played.
+        :param output_filename: Name of the concatenated MP3 file.
+        """
+        list_path = Path(f"{output_filename}.txt")
+        # a quote inside a quoted path of the list has to be written as '\''
+        paths = [Path(name).resolve().as_posix().replace("'", "'\\''") for name in audio_filenames]
+        list_path.write_text("".join(f"file '{path}'\n" for path in paths), encoding='utf-8')
+        subprocess.run(
+            [
+                get_setting('FFMPEG_BINARY'), '-y', '-f', 'concat', '-safe', '0', '-i', str(list_path),
+                '-c', 'copy', output_filename,
+            ],
+            check=True,
+        )
+        list_path.unlink()
+
+    @classmethod
+    def _get_video_codec(cls) -> Tuple[str, List[str]]:
+        """
+        Select the fastest H.264 encoder available to the ffmpeg binary used by moviepy: NVENC on NVIDIA GPUs,
+        VideoToolbox on macOS, and libx264 tuned for still images otherwise.
+
+        :return: Tuple of the codec name and the extra ffmpeg parameters for it.
+        """
+        encoders = subprocess.run(
+            [get_setting('FFMPEG_BINARY'), '-hide_banner', '-encoders'], capture_output=True, text=True, check=True
+        ).stdout
+        if 'h264_nvenc' in encoders and shutil.which('nvidia-smi'):
+            return 'h264_nvenc', ['-preset', 'p4', '-rc', 'vbr', '-cq', '23', '-pix_fmt', 'yuv420p']
+        if sys.platform == 'darwin' and 'h264_videotoolbox' in encoders:
+            return 'h264_videotoolbox', ['-pix_fmt', 'yuv420p']
+        return cls.SOFTWARE_CODEC
 
     def generate_video(
             self,
@@ -136,49 +256,54 @@ class TextToSpeechConverterAndVideoGenerator:
         if language_version not in orders:
             raise ValueError("Invalid language_version. Should be 'EN_DE' or 'DE_EN'.")
 
+        codec, ffmpeg_params = self._get_video_codec()
         video_clips = []
-        audio_clips = []
+        audio_filenames = []
         word_count = 0
         unique_words = set()
 
-        for i, row in dataframe.iterrows():
+        for i, row in enumerate(dataframe.itertuples(index=False)):
             order = orders[language_version]
             order_idx = 0 if language_version == 'EN_DE' else 1  # 0 for EN_DE and 1 for DE_EN
             audio_filename = f"{i}_{order_idx}.mp3"
             audio = AudioFileClip(audio_filename)
-            audio_clips.append(audio)
+            duration = audio.duration
+            audio.close()
+            audio_filenames.append(audio_filename)
 
-            clips = []
             if slides_format == '4slides':
-                for lang, column in order:
-                    text = row[column]
-                    clip = self._generate_text_clip(text=text, audio=audio, duration_split=4)
-                    clips.append(clip)
+                texts = [getattr(row, column) for lang, column in order]
             elif slides_format == '2slides':
-                text1 = f"{row[order[0][1]]}\n{row[order[1][1]]}"
-                text2 = f"{row[order[2][1]]}\n{row[order[3][1]]}"
-                clip1 = self._generate_text_clip(text=text1, audio=audio, duration_split=2)
-                clip2 = self._generate_text_clip(text=text2, audio=audio, duration_split=2)
-                clips.extend([clip1, clip2])
+                text1 = f"{getattr(row, order[0][1])}\n{getattr(row, order[1][1])}"
+                text2 = f"{getattr(row, order[2][1])}\n{getattr(row, order[3][1])}"
+                texts = [text1, text2]
             else:
                 raise ValueError("Invalid slides_format. Should be '2slides' or '4slides'.")
 
-            video_clips.append(concatenate_videoclips(clips))
+            video_clips.append(self._generate_slides_clip(texts=texts, duration=duration))
 
-            current_word = row["german_word"]
+            current_word = row.german_word
             if current_word not in unique_words:
                 unique_words.add(current_word)
                 word_count += 1
 
             if word_count == words_per_video or i == len(dataframe) - 1:
-                final_audio = concatenate_audioclips(audio_clips)
+                video_name = f"combined_video_{i // words_per_video + 1}_{slides_format}_{language_version}"
+                self._concatenate_audio_files(audio_filenames=audio_filenames, output_filename=f"{video_name}.mp3")
+                final_audio = AudioFileClip(f"{video_name}.mp3")
                 final_video = concatenate_videoclips(video_clips).set_audio(final_audio)
-                final_video.write_videofile(
-                    f"combined_video_{i // words_per_video + 1}_{slides_format}_{language_version}.mp4",
-                    codec='mpeg4', fps=24)
+                try:
+                    final_video.write_videofile(f"{video_name}.mp4", codec=codec, fps=24, ffmpeg_params=ffmpeg_params)
+                except OSError:
+                    # the encoder is listed by ffmpeg but cannot be opened, e.g. without a usable GPU
+                    if (codec, ffmpeg_params) == self.SOFTWARE_CODEC:
+                        raise
+                    print(f'Encoding with {codec} failed, falling back to {self.SOFTWARE_CODEC[0]}')
+                    codec, ffmpeg_params = self.SOFTWARE_CODEC
+                    final_video.write_videofile(f"{video_name}.mp4", codec=codec, fps=24, ffmpeg_params=ffmpeg_params)
 
                 video_clips = []
-                audio_clips = []
+                audio_filenames = []
                 word_count = 0
                 unique_words = set()
 
@@ -1,59 +1,88 @@
 ##
+import asyncio
+import functools
+import mimetypes
+import mmap
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import aiohttp
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 from youtube_description import description, tags
 from config import thumbnail_path_, video_path, youtube_key_path
 
 
 class YoutubeVideoPublisher:
 
-    def __init__(self, client_secrets_file: str):
+    TOKEN_PATH = Path('token.json')
+    BATCH_SIZE = 50  # maximum number of calls in one batch request
+    SNIPPET_TEMPLATE = {
+        "categoryId": "27",
+        "description": description,
+        "tags": tuple(tags),
+        "defaultAudioLanguage": "en"
+    }
+
+    def __init__(self, client_secrets_file: str, upload_chunk_size_bytes: int = 100 * 1024 * 1024):
+        # the resumable upload protocol requires chunks to be a multiple of 256 KiB
+        if upload_chunk_size_bytes % (256 * 1024) != 0:
+            raise ValueError("Invalid upload_chunk_size_bytes. Should be a multiple of 256 KiB.")
         self.client_secrets_file = client_secrets_file
+        self.upload_chunk_size_bytes = upload_chunk_size_bytes
         self.scopes = ["https://www.googleapis.com/auth/youtube.upload",
                        "https://www.googleapis.com/auth/youtube"]
+        self.credentials = None
+        self.http = None
         self.youtube = self.authenticate_youtube_api()
 
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _get_credentials(cls, client_secrets_file: str, scopes: Tuple[str, ...]) -> Credentials:
+        # cached, so that all publishers of one process share a single OAuth exchange
+        credentials = None
+        if cls.TOKEN_PATH.exists():
+            credentials = Credentials.from_authorized_user_file(str(cls.TOKEN_PATH), list(scopes))
+        if credentials and credentials.expired and credentials.refresh_token:
+            try:
+                credentials.refresh(Request())
+            except RefreshError:
+                credentials = None
+        # the browser consent is only needed when there is no cached token, or it can no longer be refreshed
+        if not credentials or not credentials.valid:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                client_secrets_file, list(scopes))
+            credentials = flow.run_local_server(port=0)
+        cls.TOKEN_PATH.write_text(credentials.to_json())
+        return credentials
+
     def authenticate_youtube_api(self):
-        flow = InstalledAppFlow.from_client_secrets_file(
-            self.client_secrets_file, self.scopes)
-        credentials = flow.run_local_server(port=0)
-        return build("youtube", "v3", credentials=credentials)
+        self.credentials = self._get_credentials(self.client_secrets_file, tuple(self.scopes))
+        # one keep-alive connection shared by all requests, so the TLS handshake is only paid once
+        self.http = AuthorizedHttp(self.credentials, http=httplib2.Http(cache=None, timeout=60))
+        # the discovery document bundled with googleapiclient is used, which is also the default for build()
+        return build("youtube", "v3", http=self.http, cache_discovery=False, static_discovery=True)
 
-    def upload_video(
-            self, video_file_path: str, title: str, thumbnail_path: str, playlist_id: str, visibility="private",
-    ) -> None:
-        request_body = {
-            "snippet": {
-                "categoryId": "27",
-                "title": title,
-                "description": description,
-                "tags": tags,
-                "defaultAudioLanguage": "en"
-            },
+    @classmethod
+    def _get_request_body(cls, title: str, visibility: str) -> Dict:
+        return {
+            "snippet": {**cls.SNIPPET_TEMPLATE, "title": title},
             "status": {
                 "privacyStatus": visibility,
                 "madeForKids": False,
             }
         }
 
-        media = MediaFileUpload(video_file_path, chunksize=-1, resumable=True)
-        request = self.youtube.videos().insert(
-            part="snippet,status",
-            body=request_body,
-            media_body=media,
-        )
-        response = request.execute()
-
-        video_id = response["id"]
-
-        request = self.youtube.thumbnails().set(
-            videoId=video_id,
-            media_body=MediaFileUpload(thumbnail_path)
-        )
-        request.execute()
-
-        playlist_item_body = {
+    @staticmethod
+    def _get_playlist_item_body(video_id: str, playlist_id: str) -> Dict:
+        return {
             "snippet": {
                 "playlistId": playlist_id,
                 "resourceId": {
@@ -62,21 +91,217 @@ class YoutubeVideoPublisher:
                 }
             }
         }
-        request = self.youtube.playlistItems().insert(
+
+    @staticmethod
+    def _get_mimetype(file_path: str) -> str:
+        return mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+    @contextmanager
+    def _open_media(self, file_path: str, resumable: bool) -> Iterator[MediaIoBaseUpload]:
+        # the upload reads straight from the memory-mapped file, so no copy of the whole file is held in memory
+        with open(file_path, "rb") as media_file, \
+                mmap.mmap(media_file.fileno(), 0, access=mmap.ACCESS_READ) as media_map:
+            yield MediaIoBaseUpload(
+                media_map,
+                mimetype=self._get_mimetype(file_path),
+                chunksize=self.upload_chunk_size_bytes,
+                resumable=resumable,
+            )
+
+    def _upload_video_with_thumbnail(
+            self, video_file_path: str, title: str, thumbnail_path: str, visibility: str,
+    ) -> str:
+        request_body = self._get_request_body(title=title, visibility=visibility)
+
+        with self._open_media(video_file_path, resumable=True) as media:
+            request = self.youtube.videos().insert(
+                part="snippet,status",
+                body=request_body,
+                media_body=media,
+            )
+            response = None
+            while response is None:
+                status, response = request.next_chunk(http=self.http)
+                if status:
+                    print(f"Uploaded {int(status.progress() * 100)}% of {video_file_path}")
+
+        video_id = response["id"]
+
+        with self._open_media(thumbnail_path, resumable=False) as media:
+            request = self.youtube.thumbnails().set(
+                videoId=video_id,
+                media_body=media
+            )
+            request.execute(http=self.http)
+        return video_id
+
+    def _add_to_playlists(self, playlist_items: List[Tuple[str, str]]) -> None:
+        # media uploads cannot be part of a batch request, so only the playlist inserts are batched
+        errors = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors.append(exception)
+
+        for start in range(0, len(playlist_items), self.BATCH_SIZE):
+            batch = self.youtube.new_batch_http_request(callback=callback)
+            for video_id, playlist_id in playlist_items[start:start + self.BATCH_SIZE]:
+                batch.add(self.youtube.playlistItems().insert(
+                    part="snippet",
+                    body=self._get_playlist_item_body(video_id=video_id, playlist_id=playlist_id)
+                ))
+            batch.execute(http=self.http)
+        if errors:
+            raise errors[0]
+
+    def upload_videos(self, videos: List[Dict], concurrent: bool = False) -> None:
+        # each video is a dict of the keyword arguments of upload_video
+        if concurrent:
+            # the uploads run side by side over aiohttp, see _upload_videos_async
+            asyncio.run(self._upload_videos_async(videos=videos))
+            return
+
+        # the uploads run one after another, and the playlist inserts are sent as batch requests
+        playlist_items = []
+        try:
+            for video in videos:
+                video_id = self._upload_video_with_thumbnail(
+                    video_file_path=video["video_file_path"],
+                    title=video["title"],
+                    thumbnail_path=video["thumbnail_path"],
+                    visibility=video.get("visibility", "private"),
+                )
+                print(f"Video uploaded with video id: {video_id}")
+                playlist_items.append((video_id, video["playlist_id"]))
+        finally:
+            # the videos uploaded before a failure are still added to their playlists
+            self._add_to_playlists(playlist_items=playlist_items)
+            for video_id, playlist_id in playlist_items:
+                print(f"Video {video_id} added to playlist {playlist_id}")
+
+    def upload_video(
+            self, video_file_path: str, title: str, thumbnail_path: str, playlist_id: str, visibility="private",
+    ) -> None:
+        video_id = self._upload_video_with_thumbnail(
+            video_file_path=video_file_path, title=title, thumbnail_path=thumbnail_path, visibility=visibility,
+        )
+        self.youtube.playlistItems().insert(
             part="snippet",
-            body=playlist_item_body
+            body=self._get_playlist_item_body(video_id=video_id, playlist_id=playlist_id)
+        ).execute(http=self.http)
+        print(f"Video uploaded and added to playlist with video id: {video_id}")
+
+    async def _get_auth_headers(self) -> Dict[str, str]:
+        # the refresh is a blocking HTTP request, so it runs in a worker thread instead of the event loop
+        if not self.credentials.valid:
+            await asyncio.to_thread(self.credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    @staticmethod
+    def _read_chunk(file_path: str, offset: int, size: int) -> bytes:
+        with open(file_path, "rb") as media_file:
+            media_file.seek(offset)
+            return media_file.read(size)
+
+    async def _insert_video_async(
+            self, session: aiohttp.ClientSession, video_file_path: str, request_body: Dict,
+    ) -> str:
+        file_size = os.path.getsize(video_file_path)
+        async with session.post(
+            "https://www.googleapis.com/upload/youtube/v3/videos",
+            params={"uploadType": "resumable", "part": "snippet,status"},
+            json=request_body,
+            headers={
+                **await self._get_auth_headers(),
+                "X-Upload-Content-Type": "video/*",
+                "X-Upload-Content-Length": str(file_size),
+            },
+        ) as response:
+            response.raise_for_status()
+            upload_url = response.headers["Location"]
+
+        offset = 0
+        while True:
+            # reading a chunk from disk blocks, so it runs in a worker thread instead of the event loop
+            chunk = await asyncio.to_thread(self._read_chunk, video_file_path, offset, self.upload_chunk_size_bytes)
+            content_range = f"bytes {offset}-{offset + len(chunk) - 1}/{file_size}"
+            async with session.put(
+                upload_url,
+                data=chunk,
+                headers={**await self._get_auth_headers(), "Content-Range": content_range},
+            ) as response:
+                if response.status == 308:
+                    # the server answers with the byte range it has received so far, e.g. "bytes=0-1048575"
+                    received = response.headers.get("Range")
+                    offset = int(received.rsplit("-", 1)[1]) + 1 if received else 0
+                    print(f"Uploaded {int(offset / file_size * 100)}% of {video_file_path}")
+                    continue
+                response.raise_for_status()
+                return (await response.json())["id"]
+
+    async def _set_thumbnail_async(self, session: aiohttp.ClientSession, video_id: str, thumbnail_path: str) -> None:
+        mimetype = self._get_mimetype(thumbnail_path)
+        thumbnail = await asyncio.to_thread(Path(thumbnail_path).read_bytes)
+        async with session.post(
+            "https://www.googleapis.com/upload/youtube/v3/thumbnails/set",
+            params={"videoId": video_id, "uploadType": "media"},
+            data=thumbnail,
+            headers={**await self._get_auth_headers(), "Content-Type": mimetype},
+        ) as response:
+            response.raise_for_status()
+
+    async def _add_to_playlist_async(self, session: aiohttp.ClientSession, video_id: str, playlist_id: str) -> None:
+        async with session.post(
+            "https://www.googleapis.com/youtube/v3/playlistItems",
+            params={"part": "snippet"},
+            json=self._get_playlist_item_body(video_id=video_id, playlist_id=playlist_id),
+            headers=await self._get_auth_headers(),
+        ) as response:
+            response.raise_for_status()
+
+    async def upload_video_async(
+            self, session: aiohttp.ClientSession, video_file_path: str, title: str, thumbnail_path: str,
+            playlist_id: str, visibility="private",
+    ) -> None:
+        request_body = self._get_request_body(title=title, visibility=visibility)
+        video_id = await self._insert_video_async(
+            session=session, video_file_path=video_file_path, request_body=request_body,
+        )
+        print(f"Video uploaded with video id: {video_id}")
+        # both calls only depend on the id of the uploaded video, and one failing does not cancel the other
+        results = await asyncio.gather(
+            self._set_thumbnail_async(session=session, video_id=video_id, thumbnail_path=thumbnail_path),
+            self._add_to_playlist_async(session=session, video_id=video_id, playlist_id=playlist_id),
+            return_exceptions=True,
         )
-        request.execute()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        print(f"Video {video_id} added to playlist {playlist_id}")
 
-        print(f"Video uploaded and added to playlist with video id: {video_id}")
+    async def _upload_videos_async(self, videos: List[Dict]) -> None:
+        connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=75)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            # a failed upload must not cancel the others, which would leave their resumable sessions half done
+            results = await asyncio.gather(
+                *(self.upload_video_async(session=session, **video) for video in videos), return_exceptions=True,
+            )
+        for video, result in zip(videos, results):
+            if isinstance(result, Exception):
+                print(f"Upload of {video['video_file_path']} failed: {result!r}")
+
+
+def main():
+    publisher = YoutubeVideoPublisher(youtube_key_path)
 
+    publisher.upload_video(
+        video_file_path=f"{video_path}/combined_video_2_2slides_EN_DE.mp4",
+        title="🎯 Get Fluent in German Faster: 10 German A1 Verbs | usage in sentence 🗣️ [2 Slides]",
+        thumbnail_path=thumbnail_path_,
+        playlist_id="PLAjw2wTAAz0b8HMusQdL2hQFXwnzMiOBV",
+        visibility="public"
+    )
 
-publisher = YoutubeVideoPublisher(youtube_key_path)
 
-publisher.upload_video(
-    video_file_path=f"{video_path}/combined_video_2_2slides_EN_DE.mp4",
-    title="🎯 Get Fluent in German Faster: 10 German A1 Verbs | usage in sentence 🗣️ [2 Slides]",
-    thumbnail_path=thumbnail_path_,
-    playlist_id="PLAjw2wTAAz0b8HMusQdL2hQFXwnzMiOBV",
-    visibility="public"
-)
+if __name__ == "__main__":
+    main()